@@ -26,7 +26,7 @@ from mawa.dataset import Dataset, Supabase
 from mawa.etl import Extraction, Transform
 from mawa.etl.table_utils import replace_tables_with_images
 from mawa.schemas.document_schema import Document
-from mawa.utils import read_json, save_json
+from mawa.utils import read_model_json, save_model_json
 
 app = typer.Typer(help="CLI for the Bordeaux city")
 data = typer.Typer(help="Data management for Bordeaux")
@@ -85,13 +85,13 @@ def transform_command(date: str) -> None:
         interim_path = interim_dir / file.name
         shutil.copy(raw_path, interim_path)
 
-        document = Document(**read_json(interim_path))
+        document = read_model_json(Document, interim_path)
         external_path = external_dir / file.with_suffix(".pdf").name
         document = replace_tables_with_images(document=document, pdf_path=external_path)
-        save_json(document.model_dump(), interim_path)
+        save_model_json(document, interim_path)
 
         # Image saving isn't mandatory, but it's there for visual inspection
-        transformer.save_images(zone=zone)
+        transformer.save_images(document)
 
 
 @app.command("prompt")
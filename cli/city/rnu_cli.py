@@ -12,7 +12,7 @@ from cli.etl_cli import extraction_command
 from cli.render_cli import render_command
 from mawa.config import RAW_DATA_DIR, City
 from mawa.schemas.document_schema import Document
-from mawa.utils import read_json, save_json
+from mawa.utils import read_model_json, save_model_json
 
 app = typer.Typer(help="CLI for the RNU National city")
 
@@ -40,8 +40,7 @@ def rnu_standardize_command() -> None:
     - Add tag to /data/3.raw/rnu_national/rnu_national.json
     """
     raw_data_path = RAW_DATA_DIR / CITY.value / f"{ZONE}.json"
-    raw_data = read_json(raw_data_path)
-    raw_doc = Document(**raw_data)
+    raw_doc = read_model_json(Document, raw_data_path)
 
     pattern = r"Article R111-\d{1,2}-?\d{,2}"
     tags: list[str] = []
@@ -59,7 +58,7 @@ def rnu_standardize_command() -> None:
                 )
                 paragraph.source_ref = source_ref
 
-    save_json(raw_doc.model_dump(), raw_data_path.with_suffix(".tags.json"))
+    save_model_json(raw_doc, raw_data_path.with_suffix(".tags.json"))
     print(f"Tags found: {tags}")
 
 
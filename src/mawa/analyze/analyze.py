@@ -15,7 +15,7 @@ from mawa.config import (
 )
 from mawa.models import GeminiModel
 from mawa.schemas import Analysis, Document
-from mawa.utils import read_json, save_json
+from mawa.utils import read_json, read_model_json, save_json, save_model_json
 
 
 class Analyze:
@@ -39,7 +39,7 @@ class Analyze:
         self.dg = dg
 
         self.doc_path = INTERIM_DATA_DIR / self.city / f"{self.zone}.json"
-        self.doc = Document(**read_json(self.doc_path))
+        self.doc = read_model_json(Document, self.doc_path)
 
         self.save_path = ANALYSIS_DATA_DIR / self.city / f"{self.zone}.analysis.json"
 
@@ -49,7 +49,7 @@ class Analyze:
         """Create the prompts for the analysis"""
         if self.dg:
             dg_path = INTERIM_DATA_DIR / self.city / f"{self.dg}.json"
-            doc_dg = Document(**read_json(dg_path))
+            doc_dg = read_model_json(Document, dg_path)
         prompts = read_json(CONFIG_DIR / "prompt" / "prompt.json")
         instruction = prompts["prompt_plu"]
 
@@ -109,7 +109,7 @@ class Analyze:
             model_metadata={k: v for k, v in json_response.items() if k != "parsed"},
         )
         self.save_path.parent.mkdir(exist_ok=True, parents=True)
-        save_json(analysis.model_dump(), self.save_path)
+        save_model_json(analysis, self.save_path)
         return analysis
 
     # Helper functions
@@ -156,7 +156,7 @@ class Analyze:
                     image_part = Part(
                         inline_data=Blob(
                             mime_type="image/jpeg",
-                            data=base64.b64decode(image_data.image_base64),
+                            data=image_data.image_bytes,
                         )
                     )
                     parts.append(image_part)
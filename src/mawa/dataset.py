@@ -17,7 +17,7 @@ from mawa.config import (
     City,
 )
 from mawa.schemas import Analysis, Document
-from mawa.utils import read_json
+from mawa.utils import read_json, read_model_json
 
 load_dotenv()
 
@@ -74,14 +74,14 @@ class Dataset:
         dg_path = self.raw_data_dir / "dispositions_generales.json"
         has_dg = dg_path.exists()
         if has_dg:
-            dg_data = Document(**read_json(dg_path))
+            dg_data = read_model_json(Document, dg_path)
             df_source = self._add_source_row(df_source, dg_data)
             source_count += 1
 
         prev_plu_path = None
 
         for file in self.analysis_data_dir.glob("*.analysis.json"):
-            analysis = Analysis(**read_json(file))
+            analysis = read_model_json(Analysis, file)
             analysis.model_metadata.pop("candidates", None)
             df_doc = self._add_doc_row(df_doc, analysis, has_dg)
             doc_count += 1
@@ -90,7 +90,7 @@ class Dataset:
             plu_path = self.raw_data_dir / f"{name_of_document}.tags.json"
 
             if plu_path != prev_plu_path:
-                plu_data = Document(**read_json(plu_path))
+                plu_data = read_model_json(Document, plu_path)
                 df_source = self._add_source_row(df_source, plu_data)
                 source_count += 1
 
@@ -125,7 +125,7 @@ class Dataset:
             "city": self.city,
             "document_name": document.name_of_document,
             "source_data": json.dumps(
-                document.model_dump(), ensure_ascii=False
+                document.model_dump(mode="json"), ensure_ascii=False
             ),  # JSON dumps to ensure strings are properly double quoted
             "source_images_path": json.dumps(
                 self._get_images_path(document), ensure_ascii=False
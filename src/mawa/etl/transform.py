@@ -1,5 +1,10 @@
-import base64
+import binascii
+import hashlib
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache, partial
 from io import BytesIO
 from pathlib import Path
 from typing import Optional, Tuple
@@ -16,7 +21,11 @@ from mawa.config import (
 )
 from mawa.models import GeminiModel
 from mawa.schemas.document_schema import Document, Page, Paragraph
-from mawa.utils import read_json, save_json
+from mawa.schemas.ocr_schema import Image as ImageSchema
+from mawa.utils import read_json, read_model_json, save_model_json
+
+# Upper bound of the threads writing the zone documents and their images
+MAX_WORKERS = 8
 
 
 class Transform:
@@ -86,64 +95,82 @@ class Transform:
 
         # Overwrite the raw OCR response with the formatted document
         self.raw_path.parent.mkdir(exist_ok=True, parents=True)
-        save_json(document.model_dump(), self.raw_path)
+        save_model_json(document, self.raw_path)
 
-    def clean_document(self) -> None:
+    def clean_document(self) -> Path:
         """Clean the document by removing duplicates
         TODO: Improve funciton to remove all non necessary images and text
-        """
-        document = read_json(self.raw_path)
-        document = Document(**document)
 
-        # Count occurences of all page.content and images
-        images_dict = {}
+        Returns:
+            The path of the cleaned document
+        """
+        document = read_model_json(Document, self.raw_path)
 
+        # Group the images by the digest of their payload, exact copies end up in
+        # the same group and are only decoded and hashed once
+        images_by_digest: dict[bytes, list[tuple[Page, ImageSchema]]] = defaultdict(
+            list
+        )
         for page in document.pages:
             for image in page.images:
-                b64 = image.image_base64
-                hash = _get_image_hash_from_base64(b64)
-                name_img = image.name_img
-                images_dict[name_img] = {
-                    "page_index": page.index,
-                    "image_hash": hash,
-                    "image": image,
-                }
-
-        # Create a mapping of page index to page object for quick lookup
-        page_map = {page.index: page for page in document.pages}
+                digest = hashlib.sha256(image.image_base64).digest()
+                images_by_digest[digest].append((page, image))
 
-        # Get duplicated images
-        duplicated_images = []
-        img_name_set = set[str]()
-        for name_img1, image_data1 in images_dict.items():
-            for name_img2, image_data2 in images_dict.items():
-                if name_img1 >= name_img2:
-                    continue
-
-                if image_data1["image_hash"] - image_data2["image_hash"] < 5:
-                    if image_data1["image"].name_img not in img_name_set:
-                        img_name_set.add(image_data1["image"].name_img)
-                        duplicated_images.append(image_data1)
-                    if image_data2["image"].name_img not in img_name_set:
-                        img_name_set.add(image_data2["image"].name_img)
-                        duplicated_images.append(image_data2)
-
-        # Remove duplicated images
-        for image_data in duplicated_images:
-            # Remove image from page
-            page = page_map[image_data["page_index"]]
-            page.images.remove(image_data["image"])
-
-            # Remove image tag from paragraph
-            image_name = image_data["image"].name_img
-            image_tag = f"![{image_name}]({image_name})"
-            for paragraph in page.paragraphs:
-                if image_tag in paragraph.content:
-                    paragraph.content = paragraph.content.replace(image_tag, "")
-                    paragraph.content = paragraph.content.strip()
-                    break
-
-        save_json(document.model_dump(), self.raw_path)
+        # Get duplicated images, identical payloads first, then similar ones
+        duplicated_digests = {
+            digest for digest, images in images_by_digest.items() if len(images) > 1
+        }
+        # A single distinct payload has nothing to be compared with, skip decoding it
+        if len(images_by_digest) > 1:
+            # PIL releases the GIL while decoding, so the payloads are hashed in threads
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                hashes = executor.map(
+                    _get_image_hash,
+                    [images[0][1] for images in images_by_digest.values()],
+                )
+                images_hash = dict(zip(images_by_digest, hashes))
+            # Payloads that can't be decoded are only matched on their digest
+            digests = [d for d, value in images_hash.items() if value is not None]
+            for i, digest1 in enumerate(digests):
+                for digest2 in digests[i + 1 :]:
+                    if images_hash[digest1] - images_hash[digest2] < 5:
+                        duplicated_digests.update((digest1, digest2))
+
+        # Remove duplicated images, keeping the names removed from each page
+        removed_names: dict[int, set[str]] = defaultdict(set)
+        for digest in duplicated_digests:
+            for page, image in images_by_digest[digest]:
+                page.images.remove(image)
+                removed_names[page.index].add(image.name_img)
+
+        # Remove the image tags and bare names from the paragraphs of the pages the
+        # images were removed from, as names can be reused by other pages.
+        # Every reference of a page is matched in a single pass.
+        for page in document.pages:
+            img_name_set = removed_names.get(page.index)
+            if img_name_set:
+                references = [f"![{name}]({name})" for name in img_name_set]
+                references.extend(img_name_set)
+                references_pattern = _build_pattern(tuple(sorted(references)))
+                references_set = frozenset(references)
+                # Walk backwards so paragraphs can be deleted in place
+                paragraphs = page.paragraphs
+                for i in range(len(paragraphs) - 1, -1, -1):
+                    paragraph = paragraphs[i]
+                    # A paragraph made of a single reference is dropped without a scan
+                    if paragraph.content.strip() in references_set:
+                        del paragraphs[i]
+                        continue
+                    content, count = references_pattern.subn("", paragraph.content)
+                    if not count:
+                        continue
+                    paragraph.content = content.strip()
+                    # Drop the paragraphs that only contained image references
+                    if not paragraph.content:
+                        del paragraphs[i]
+
+        save_model_json(document, self.raw_path)
+        return self.raw_path
 
     def pages_splitting(self, model: Optional[str] = "flash") -> None:
         """Transform the formatted OCR output in a standard format.
@@ -153,8 +180,7 @@ class Transform:
             model (Optional[str]): The model to use for the Gemini model
         """
         # Load document from save_path (3.raw)
-        document_data = read_json(self.raw_path)
-        document = Document(**document_data)
+        document = read_model_json(Document, self.raw_path)
 
         parts, response_schema = _generate_prompt_parts_split(document)
 
@@ -163,57 +189,86 @@ class Transform:
             prompt=parts,
             json_schema=response_schema,
         )
-        json_response = response.model_dump()
-
         self.page_split_path.parent.mkdir(exist_ok=True, parents=True)
-        save_json(json_response, self.page_split_path)
+        save_model_json(response, self.page_split_path)
 
     def split_documents(self):
-        """Split the document into multiple documents based on the zone."""
-        document = read_json(self.raw_path)
-        document = Document(**document)
+        """Split the document into multiple documents based on the zone.
+        The zones are independent, so they are written concurrently by a single
+        bounded thread pool shared with the image writes.
+        """
+        document = read_model_json(Document, self.raw_path)
 
         page_splitting = read_json(self.page_split_path)
 
+        # A zone can be returned several times by the model, its pages are merged
+        # so that a single task writes each zone file
+        zone_pages: dict[str, dict[int, None]] = defaultdict(dict)
+        for page_split in page_splitting["parsed"]:
+            zone_pages[page_split["zone"]].update(dict.fromkeys(page_split["pages"]))
+        page_splits = [
+            {"zone": zone, "pages": list(pages)} for zone, pages in zone_pages.items()
+        ]
+
         # Create a mapping of page index to page object for safe lookup
         page_map = {page.index: page for page in document.pages}
+        write_zone = partial(self._write_zone, document, page_map)
 
-        for page_split in page_splitting["parsed"]:
-            zone = page_split["zone"]
-            page_indices = page_split["pages"]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            doc_zones = list(executor.map(write_zone, page_splits))
+            for doc_zone in doc_zones:
+                if doc_zone is not None:
+                    self.save_images(doc_zone, executor)
 
-            # Get pages by their index property (not list position)
-            selected_pages = [
-                page_map[page_idx] for page_idx in page_indices if page_idx in page_map
-            ]
+    def save_images(
+        self, doc_zone: Document, executor: Optional[ThreadPoolExecutor] = None
+    ) -> None:
+        """Save the images of a zone document to the /data/interim/city/zone/ folder
 
-            if not selected_pages:
-                continue
+        Args:
+            doc_zone (Document): The zone document to save the images of
+            executor (Optional[ThreadPoolExecutor]): The pool writing the images,
+                a bounded one is created when not given
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                return self.save_images(doc_zone, executor)
 
-            doc_zone = document.model_copy(
-                update={"pages": selected_pages, "zone": zone}
-            )
-            save_path = self.interim_dir / f"{zone}.json"
-            save_path.parent.mkdir(exist_ok=True, parents=True)
-            save_json(doc_zone.model_dump(), save_path)
+        image_dir = self.interim_dir / doc_zone.zone
+        image_dir.mkdir(exist_ok=True, parents=True)
 
-            self.save_images(zone)
+        images = [image for page in doc_zone.pages for image in page.images]
+        # Consume the iterator to propagate exceptions
+        list(executor.map(partial(_save_image, image_dir=image_dir), images))
 
-    def save_images(self, zone: str) -> None:
-        """Save the images to the /data/interim/city/zone/ folder"""
-        doc_zone = read_json(self.interim_dir / f"{zone}.json")
-        doc_zone = Document(**doc_zone)
+    def save_images_by_zone(self, zone: str) -> None:
+        """Save the images of a zone document already written to the interim folder"""
+        doc_zone = read_model_json(Document, self.interim_dir / f"{zone}.json")
 
         assert doc_zone.zone == zone, f"Expected {zone}, got {doc_zone.zone}"
 
-        for page in doc_zone.pages:
-            for image in page.images:
-                image_base64 = image.image_base64
-                image_dir = self.interim_dir / zone
-                image_dir.mkdir(exist_ok=True, parents=True)
-                image_path = (image_dir / image.name_img).with_suffix(".jpg")
-                with open(image_path, "wb") as f:
-                    f.write(base64.b64decode(image_base64))
+        self.save_images(doc_zone)
+
+    def _write_zone(
+        self, document: Document, page_map: dict[int, Page], page_split: dict
+    ) -> Optional[Document]:
+        """Write the document of a single zone, None when it has no pages."""
+        zone = page_split["zone"]
+        page_indices = page_split["pages"]
+
+        # Get pages by their index property (not list position)
+        selected_pages = [
+            page_map[page_idx] for page_idx in page_indices if page_idx in page_map
+        ]
+
+        if not selected_pages:
+            return None
+
+        doc_zone = document.model_copy(update={"pages": selected_pages, "zone": zone})
+        save_path = self.interim_dir / f"{zone}.json"
+        save_path.parent.mkdir(exist_ok=True, parents=True)
+        save_model_json(doc_zone, save_path)
+        return doc_zone
 
 
 # Helper functions
@@ -227,8 +282,7 @@ def _generate_prompt_parts_split(document: Document) -> Tuple[list[str], dict]:
     Returns:
         Tuple containing list of page markdown strings, and response schema
     """
-    prompt_template = read_json(CONFIG_DIR / "prompt" / "prompt.json")
-    instruction = prompt_template["prompt_extract_zones"]
+    instruction = _load_prompt_template()["prompt_extract_zones"]
 
     # Reconstruct markdown from paragraphs (join with \n\n as in ocr_response_to_document)
     parts = [instruction] + [
@@ -236,13 +290,49 @@ def _generate_prompt_parts_split(document: Document) -> Tuple[list[str], dict]:
         for page in document.pages
     ]
 
-    schema_path = CONFIG_DIR / "schemas" / "response_schema_pages.json"
-    response_schema_pages = read_json(schema_path)
+    return parts, _load_response_schema_pages()
+
 
-    return parts, response_schema_pages
+@lru_cache(maxsize=1)
+def _load_prompt_template() -> dict:
+    """Load the prompts once, they do not change during a run."""
+    return read_json(CONFIG_DIR / "prompt" / "prompt.json")
 
 
-def _get_image_hash_from_base64(base64_string: str) -> imagehash.ImageHash:
-    img_data = base64.b64decode(base64_string)
-    img = Image.open(BytesIO(img_data))
-    return imagehash.phash(img)
+@lru_cache(maxsize=1)
+def _load_response_schema_pages() -> dict:
+    """Load the page split response schema once, it does not change during a run."""
+    return read_json(CONFIG_DIR / "schemas" / "response_schema_pages.json")
+
+
+@lru_cache(maxsize=32)
+def _build_pattern(names: tuple[str, ...]) -> re.Pattern:
+    """Compile an alternation matching any of the names.
+    Longest names come first so a name is never shadowed by one of its prefixes,
+    e.g. a tag is removed whole rather than only the image name inside it.
+    """
+    names = sorted(names, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, names)))
+
+
+def _save_image(image: ImageSchema, image_dir: Path) -> None:
+    image_path = (image_dir / image.name_img).with_suffix(".jpg")
+    with open(image_path, "wb") as f:
+        f.write(image.image_bytes)
+
+
+def _get_image_hash(image: ImageSchema) -> Optional[imagehash.ImageHash]:
+    # PIL decodes lazily, so a truncated image only fails once the pixels are read:
+    # the whole decode is guarded, OSError also covers UnidentifiedImageError
+    try:
+        # phash works on grayscale anyway, and reduce doesn't support every mode
+        # (palette, 1-bit, 16-bit), so the image is converted first
+        img = Image.open(BytesIO(image.image_bytes)).convert("L")
+        # phash works on a 32x32 thumbnail, a cheap integer downscale to ~256px
+        # first avoids resampling the full resolution image
+        factor = min(img.size) // 256
+        if factor > 1:
+            img = img.reduce(factor)
+        return imagehash.phash(img)
+    except (binascii.Error, OSError):
+        return None
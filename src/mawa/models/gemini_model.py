@@ -1,4 +1,6 @@
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 
 from dotenv import load_dotenv
@@ -13,31 +15,28 @@ from mawa.config import GEMINI_FLASH_MODEL, GEMINI_PRO_MODEL
 
 load_dotenv()
 
+# Upper bound of the concurrent count_tokens requests
+MAX_WORKERS = 8
 
+# $ per 1M tokens, each tier is (upper bound of the token count, price)
 PRICING = {
     "gemini-3-pro-preview": {
-        "input_up_to_200k": 2.0,  # $ par 1M tokens
-        "input_200k_to_1M": 4.0,
-        "output_up_to_200k": 12.00,
-        "output_200k_to_1M": 18.00,
-        "cache_up_to_200k": 0.20,
-        "cache_200k_to_1M": 0.40,
-        "cache_storage": 4.50,  # $ per 1M tokens
+        "input": [(200_000, 2.0), (math.inf, 4.0)],
+        "output": [(200_000, 12.00), (math.inf, 18.00)],
+        "cache": [(200_000, 0.20), (math.inf, 0.40)],
+        "cache_storage": 4.50,  # $ per 1M tokens per hour
     },
     "gemini-2.5-pro": {
-        "input_up_to_200k": 1.25,  # $ par 1M tokens
-        "input_200k_to_1M": 2.50,
-        "output_up_to_200k": 10.00,
-        "output_200k_to_1M": 15.00,
-        "cache_up_to_200k": 0.125,
-        "cache_200k_to_1M": 0.25,
-        "cache_storage": 4.50,  # $ per 1M tokens
+        "input": [(200_000, 1.25), (math.inf, 2.50)],
+        "output": [(200_000, 10.00), (math.inf, 15.00)],
+        "cache": [(200_000, 0.125), (math.inf, 0.25)],
+        "cache_storage": 4.50,  # $ per 1M tokens per hour
     },
     "gemini-2.5-flash": {
-        "input": 0.30,
-        "output": 2.50,
-        "cache": 0.03,
-        "cache_storage": 1.00,  # $ per 1M tokens
+        "input": [(math.inf, 0.30)],
+        "output": [(math.inf, 2.50)],
+        "cache": [(math.inf, 0.03)],
+        "cache_storage": 1.00,  # $ per 1M tokens per hour
     },
 }
 
@@ -87,6 +86,23 @@ class GeminiModel:
         tokens = self._calculate_cost(tokens)
         return tokens
 
+    def batch_input_tokens_metadata(
+        self, prompts: list[list[Part]]
+    ) -> list[dict[str, Any]]:
+        """
+        Calculate the input cost of several prompts at once.
+        The count_tokens requests are sent concurrently from a thread pool,
+        so the latency is the one of a single round-trip instead of N.
+
+        Args:
+            prompts (list[list[Part]]): The prompts to count the tokens of
+
+        Returns:
+            The tokens metadata of each prompt, in the same order
+        """
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            return list(executor.map(self.input_tokens_metadata, prompts))
+
     def output_tokens_metadata(self, tokens: dict) -> dict[str, Any]:
         """
         Calculate the output cost based on the output tokens metadata.
@@ -97,7 +113,7 @@ class GeminiModel:
 
     # Helper functions
 
-    def _calculate_cost(self, tokens: dict) -> float:
+    def _calculate_cost(self, tokens: dict) -> dict[str, Any]:
         if self.model not in PRICING:
             return tokens
 
@@ -115,35 +131,12 @@ class GeminiModel:
         output_tokens = tokens.get("candidates_token_count", 0)
         output_tokens += tokens.get("thoughts_token_count", 0)
 
-        input_cost = 0
-        output_cost = 0
-        hourly_cache_cost = 0
+        input_cost = input_tokens * _tier_price(input_tokens, prices["input"])
+        input_cost += cached_tokens * _tier_price(cached_tokens, prices["cache"])
+        output_cost = output_tokens * _tier_price(output_tokens, prices["output"])
 
-        if self.model == "gemini-3-pro-preview" or self.model == "gemini-2.5-pro":
-            if input_tokens <= 200_000:
-                input_cost += input_tokens * prices["input_up_to_200k"]
-            else:
-                input_cost += input_tokens * prices["input_200k_to_1M"]
-
-            if cached_tokens <= 200_000:
-                input_cost += cached_tokens * prices["cache_up_to_200k"]
-            else:
-                input_cost += cached_tokens * prices["cache_200k_to_1M"]
-
-            if output_tokens <= 200_000:
-                output_cost += output_tokens * prices["output_up_to_200k"]
-            else:
-                output_cost += output_tokens * prices["output_200k_to_1M"]
-
-            hourly_cache_cost = cached_tokens * prices["cache_storage"]
-            storage_cost = time_taken * hourly_cache_cost / 3600
-
-        elif self.model == "gemini-2.5-flash":
-            input_cost += input_tokens * prices["input"]
-            input_cost += cached_tokens * prices["cache"]
-            output_cost += output_tokens * prices["output"]
-            hourly_cache_cost = cached_tokens * prices["cache_storage"]
-            storage_cost = time_taken * hourly_cache_cost / 3600
+        hourly_cache_cost = cached_tokens * prices["cache_storage"]
+        storage_cost = time_taken * hourly_cache_cost / 3600
 
         tokens["input_token_cost"] = (input_cost) / 1_000_000
         tokens["output_token_cost"] = (output_cost) / 1_000_000
@@ -152,3 +145,11 @@ class GeminiModel:
         tokens["storage_cost"] = storage_cost / 1_000_000
 
         return tokens
+
+
+def _tier_price(tokens: int, tiers: list[tuple[float, float]]) -> float:
+    """Return the price of the tier the token count falls in."""
+    for upper_bound, price in tiers:
+        if tokens <= upper_bound:
+            return price
+    return tiers[-1][1]
@@ -23,13 +23,15 @@ class MistralOCR:
         Returns:
             The ID of the uploaded file.
         """
-        return self.client.files.upload(
-            file={
-                "file_name": file_path.name,
-                "content": open(file_path, mode="rb"),
-            },
-            purpose="ocr",
-        ).id
+        # The open file is streamed by the multipart upload, and closed afterwards
+        with open(file_path, mode="rb") as content:
+            return self.client.files.upload(
+                file={
+                    "file_name": file_path.name,
+                    "content": content,
+                },
+                purpose="ocr",
+            ).id
 
     def process_ocr(self, file_id: str) -> OCRResponse:
         """Process OCR on a file.
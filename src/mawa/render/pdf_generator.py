@@ -8,13 +8,16 @@ Author: Grey Panda (optimized by Boat)
 """
 
 import html
-import json
+import os
 import re
 import warnings
+from collections import defaultdict
 from dataclasses import dataclass, field
 from functools import lru_cache
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
 
+import orjson
 from reportlab.graphics import renderPDF
 from reportlab.lib.colors import HexColor, black
 from reportlab.lib.enums import TA_CENTER
@@ -29,6 +32,7 @@ from reportlab.platypus.tableofcontents import TableOfContents
 from svglib.svglib import svg2rlg
 
 from mawa.config import CONFIG_DIR, DOCS_DIR, IMAGES_DIR
+from mawa.utils import read_json
 
 FONTS_DIR = DOCS_DIR / "fonts"
 
@@ -139,8 +143,9 @@ class StyleFactory:
         return ParagraphStyle(name=name, **defaults)
 
     @classmethod
+    @lru_cache(maxsize=None)
     def heading(cls, level: int) -> ParagraphStyle:
-        """Create heading styles."""
+        """Create heading styles, cached per level and shared between paragraphs."""
         configs = {
             1: {
                 "font": FONT_BOLD,
@@ -176,31 +181,52 @@ class StyleFactory:
         return cls.create(f"H{level}", **config)
 
 
+_BODY_STYLE = StyleFactory.create(
+    "Body", size=11, leading=16, spaceAfter=8, textColor=HexColor("#222222")
+)
+
+
 # ============================================================================
 # Utility Functions
 # ============================================================================
 
+_NUM_RE = re.compile(r"(\d+)")
+_NUMS_RE = re.compile(r"\d+")
+_SECTION_NUM_RE = re.compile(r"section_(\d+)_(\d+)")
+_NON_SLUG_RE = re.compile(r"[^\w\s-]")
+_SEPARATORS_RE = re.compile(r"[-\s]+")
+# Already a slug: lowercase ASCII words separated by single dashes
+_IS_SLUG = re.compile(r"\A(?:[a-z0-9]|-(?!-))+\Z").match
+
 
 def _slugify(text: str) -> str:
     """Convert text to URL-friendly slug."""
-    slug = re.sub(r"[^\w\s-]", "", text).strip().lower()
-    return re.sub(r"[-\s]+", "-", slug) or "section"
+    if _IS_SLUG(text):
+        return text
+    slug = _NON_SLUG_RE.sub("", text).strip().lower()
+    return _SEPARATORS_RE.sub("-", slug) or "section"
 
 
-def _extract_number(pattern: str, text: str) -> Optional[str]:
-    """Extract number from text using regex pattern."""
-    match = re.search(pattern, text or "")
+def _extract_number(pattern: re.Pattern, text: str) -> Optional[str]:
+    """Extract number from text using a compiled regex pattern."""
+    match = pattern.search(text or "")
     return match.group(1) if match else None
 
 
+def _number_sort_key(key: str) -> int:
+    """Sort key ordering keys like 'chapitre_2' before 'chapitre_10'."""
+    match = _NUM_RE.search(key or "")
+    return int(match.group(1)) if match else 0
+
+
 def _chapter_number(key: str) -> Optional[str]:
     """Extract chapter number from key like 'chapitre_1'."""
-    return _extract_number(r"(\d+)", key)
+    return _extract_number(_NUM_RE, key)
 
 
 def _section_number(key: str) -> Optional[str]:
     """Extract section number from key like 'section_1_2'."""
-    match = re.match(r"section_(\d+)_(\d+)", key or "")
+    match = _SECTION_NUM_RE.match(key or "")
     return f"{match.group(1)}.{match.group(2)}" if match else None
 
 
@@ -236,14 +262,18 @@ def _compose_heading(number: Optional[str], title: str) -> str:
 
 
 @lru_cache(maxsize=1)
-def _load_schema_titles() -> Dict[str, Dict[str, str]]:
-    """Load chapter and section titles from schema."""
+def _load_schema_titles() -> Mapping[str, Mapping[str, str]]:
+    """Load chapter and section titles from schema.
+
+    The result is cached and shared by every report, so it is returned read-only.
+    """
     schema_path = CONFIG_DIR / "schemas" / "response_schema_synthese.json"
     if not schema_path.exists():
-        return {"chapters": {}, "sections": {}}
+        return MappingProxyType(
+            {"chapters": MappingProxyType({}), "sections": MappingProxyType({})}
+        )
 
-    with open(schema_path, encoding="utf-8") as f:
-        schema = json.load(f)
+    schema = read_json(schema_path)
 
     chapters, sections = {}, {}
     for chap_key, chap_meta in schema.get("properties", {}).items():
@@ -251,7 +281,9 @@ def _load_schema_titles() -> Dict[str, Dict[str, str]]:
         for sec_key, sec_meta in chap_meta.get("properties", {}).items():
             sections[sec_key] = sec_meta.get("description", "").strip()
 
-    return {"chapters": chapters, "sections": sections}
+    return MappingProxyType(
+        {"chapters": MappingProxyType(chapters), "sections": MappingProxyType(sections)}
+    )
 
 
 # ============================================================================
@@ -259,11 +291,17 @@ def _load_schema_titles() -> Dict[str, Dict[str, str]]:
 # ============================================================================
 
 
+@lru_cache(maxsize=32)
+def _load_svg(svg_path: str, mtime: float):
+    """Parse SVG once per file version. The cached drawing must not be mutated."""
+    return svg2rlg(svg_path)
+
+
 def _scale_and_draw_svg(
     canvas, svg_path: str, x: float, y: float, target_width_cm: float
 ) -> Optional[float]:
     """Scale and draw SVG at specified position. Returns bottom y-coordinate."""
-    drawing = svg2rlg(svg_path)
+    drawing = _load_svg(svg_path, os.path.getmtime(svg_path))
     if not drawing or (drawing.width == 0 and drawing.height == 0):
         return None
 
@@ -277,17 +315,16 @@ def _scale_and_draw_svg(
     else:
         scale = target_width / drawing.width
 
-    drawing.width *= scale
-    drawing.height *= scale
-    drawing.scale(scale, scale)
-
+    # Scale on the canvas rather than on the shared drawing
     canvas.saveState()
     try:
-        renderPDF.draw(drawing, canvas, x, y)
+        canvas.translate(x, y)
+        canvas.scale(scale, scale)
+        renderPDF.draw(drawing, canvas, 0, 0)
     finally:
         canvas.restoreState()
 
-    return y - drawing.height
+    return y - drawing.height * scale
 
 
 def _draw_centered_logo(
@@ -301,9 +338,19 @@ def _draw_centered_logo(
 
 
 def _draw_corner_logo(canvas, logo_path: str, width_cm: float = 2.0):
-    """Draw logo at bottom-left corner."""
-    if logo_path:
+    """Draw logo at bottom-left corner.
+
+    The logo is drawn once into a form XObject, which each page then references.
+    """
+    if not logo_path:
+        return
+
+    form_name = "CornerLogo"
+    if not canvas.hasForm(form_name):
+        canvas.beginForm(form_name)
         _scale_and_draw_svg(canvas, logo_path, 1.6 * cm, 0.2 * cm, width_cm)
+        canvas.endForm()
+    canvas.doForm(form_name)
 
 
 # ============================================================================
@@ -338,31 +385,48 @@ def _extract_parsed_data(raw_data: Dict[str, Any]) -> Dict[str, Any]:
     if not isinstance(raw_data, dict):
         return {}
 
-    # Try direct parsed field
-    if "parsed" in raw_data and isinstance(raw_data["parsed"], dict):
-        return raw_data["parsed"]
+    # Try the chapters of a formatted Analysis (see Analyze.format_analysis)
+    chapters = raw_data.get("chapters")
+    if isinstance(chapters, dict):
+        return chapters
+
+    # Try direct parsed field (structured output of the model)
+    parsed = raw_data.get("parsed")
+    if isinstance(parsed, dict):
+        return parsed
 
     # Try response.parsed
-    response = raw_data.get("response", {})
-    if isinstance(response, dict) and "parsed" in response:
-        if isinstance(response["parsed"], dict):
-            return response["parsed"]
+    response = raw_data.get("response")
+    if isinstance(response, dict):
+        parsed = response.get("parsed")
+        if isinstance(parsed, dict):
+            return parsed
 
     # Try candidates (Gemini-style)
-    for candidate in raw_data.get("candidates", []):
-        for part in candidate.get("content", {}).get("parts", []):
+    candidates = raw_data.get("candidates")
+    if not candidates:
+        return {}
+
+    for candidate in candidates:
+        content = candidate.get("content")
+        if not content:
+            continue
+        for part in content.get("parts") or ():
             text = part.get("text")
-            if text:
-                try:
-                    parsed = json.loads(text)
-                    if isinstance(parsed, dict):
-                        return (
-                            parsed.get("parsed", parsed)
-                            if "parsed" in parsed
-                            else parsed
-                        )
-                except json.JSONDecodeError:
-                    continue
+            if not text:
+                continue
+            # Skip commentary parts without running the JSON parser on them
+            text = text.lstrip()
+            if not text or text[0] not in "{[":
+                continue
+            try:
+                parsed = orjson.loads(text)
+                if isinstance(parsed, dict):
+                    return (
+                        parsed.get("parsed", parsed) if "parsed" in parsed else parsed
+                    )
+            except orjson.JSONDecodeError:
+                continue
 
     return {}
 
@@ -392,12 +456,7 @@ def _build_from_parsed(
     """Build sections from parsed format."""
     sections = []
 
-    for chap_key in sorted(
-        parsed.keys(),
-        key=lambda k: int(
-            re.search(r"(\d+)", k or "").group(1) if re.search(r"(\d+)", k or "") else 0
-        ),
-    ):
+    for chap_key in sorted(parsed.keys(), key=_number_sort_key):
         chap_data = parsed.get(chap_key, {})
         if not isinstance(chap_data, dict):
             continue
@@ -405,9 +464,8 @@ def _build_from_parsed(
         subsections = []
         for sec_key in sorted(
             chap_data.keys(),
-            key=lambda k: tuple(
-                map(int, re.findall(r"\d+", k or "")) or [float("inf")]
-            ),
+            key=lambda k: tuple(map(int, _NUMS_RE.findall(k or "")))
+            or (float("inf"),),
         ):
             regles = _normalize_regles(chap_data.get(sec_key))
             if regles:
@@ -425,7 +483,7 @@ def _build_from_legacy(
     """Build sections from legacy format."""
     sections = []
 
-    for sec_key in sorted(response.keys()):
+    for sec_key in sorted(response.keys(), key=_number_sort_key):
         sous_sections = response.get(sec_key, [])
         if not isinstance(sous_sections, list):
             continue
@@ -509,12 +567,12 @@ def _make_section(key: str, subsections: List[Subsection], titles: Dict) -> Sect
 
 def _ensure_unique_bookmarks(sections: List[Section]) -> List[Section]:
     """Ensure all bookmarks are unique."""
-    seen = {}
+    seen = defaultdict(int)
 
     def make_unique(base: str) -> str:
-        count = seen.get(base, 0)
-        seen[base] = count + 1
-        return base if count == 0 else f"{base}-{count + 1}"
+        seen[base] += 1
+        count = seen[base]
+        return base if count == 1 else f"{base}-{count}"
 
     for section in sections:
         section.bookmark = make_unique(section.bookmark)
@@ -560,35 +618,38 @@ def _add_section_to_story(
     toc_level: Optional[int] = None,
 ):
     """Add a section with optional bookmark to story."""
-    para = Paragraph(title, StyleFactory.heading(level))
+    # The anchor creates the bookmark where the heading is drawn
+    text = f'<a name="{bookmark}"/>{title}' if bookmark else title
+    para = Paragraph(text, StyleFactory.heading(level))
 
     # Set TOC attributes if this should appear in TOC
     if toc_level is not None:
+        para._is_toc_entry = True
         para._headingLevel = toc_level
         para._headingText = title
 
-    # IMPORTANT: Set bookmark name on the paragraph itself
-    # This ensures the bookmark is created when the paragraph is drawn
+    # The outline entry is added by the afterFlowable handler once drawn
     if bookmark:
+        para._is_outline_entry = True
         para._bookmarkName = bookmark
-        # Also manually add the outline entry via a flowable for navigation
-        story.append(BookmarkFlowable(bookmark, title, level - 1))
+        para._outlineText = title
+        para._outlineLevel = max(0, level - 1)
 
     story.append(para)
 
     if content:
-        body_style = StyleFactory.create(
-            "Body", size=11, leading=16, spaceAfter=8, textColor=HexColor("#222222")
-        )
-        story.append(Paragraph(content, body_style))
+        story.append(Paragraph(content, _BODY_STYLE))
 
 
 def _add_regles_to_story(story: List, regles: List[Regle]):
     """Add rules to story."""
     for regle in regles:
-        text = html.escape(regle.contenu)
-        if regle.source_ref:
-            text += f' <font size="9" color="#888888">({html.escape(regle.source_ref)})</font>'
+        contenu = html.escape(regle.contenu)
+        text = (
+            f'{contenu} <font size="9" color="#888888">({html.escape(regle.source_ref)})</font>'
+            if regle.source_ref
+            else contenu
+        )
         _add_section_to_story(story, "", text, level=4)
 
 
@@ -856,8 +917,7 @@ def generate_pdf_report(
                      ]
     """
     # Load and normalize data
-    with open(json_path, encoding="utf-8") as f:
-        data = json.load(f)
+    data = read_json(json_path)
 
     sections = _ensure_unique_bookmarks(_build_sections(data))
     metadata = data.get("metadata", {})
@@ -883,9 +943,16 @@ def generate_pdf_report(
         author="SIFT - MEWE",
     )
 
-    # TOC notification handler
+    # TOC notification and outline handler
     def after_flowable(flowable):
-        if hasattr(flowable, "_headingLevel") and hasattr(flowable, "_headingText"):
+        if getattr(flowable, "_is_outline_entry", False):
+            doc.canv.addOutlineEntry(
+                flowable._outlineText,
+                flowable._bookmarkName,
+                flowable._outlineLevel,
+                closed=0,
+            )
+        if getattr(flowable, "_is_toc_entry", False):
             doc.notify(
                 "TOCEntry",
                 (
@@ -898,7 +965,11 @@ def generate_pdf_report(
 
     doc.afterFlowable = after_flowable
 
-    # Page handlers
+    # Page handlers, the footer text and its width never change between pages
+    footer_text = "Sommaire ↑"
+    footer_width = pdfmetrics.stringWidth(footer_text, FONT_REGULAR, 8)
+    footer_color = HexColor("#666666")
+
     def on_first_page(canvas, doc_obj):
         if logo_path:
             _draw_centered_logo(canvas, logo_path)
@@ -914,16 +985,14 @@ def generate_pdf_report(
         if doc_obj.page >= 4:
             # TOC link in footer
             canvas.setFont(FONT_REGULAR, 8)
-            canvas.setFillColor(HexColor("#666666"))
-            text = "Sommaire ↑"
-            text_width = canvas.stringWidth(text, FONT_REGULAR, 8)
-            x_pos = A4[0] - doc_obj.rightMargin - text_width - 0.2 * cm
+            canvas.setFillColor(footer_color)
+            x_pos = A4[0] - doc_obj.rightMargin - footer_width - 0.2 * cm
             y_pos = 0.8 * cm
-            canvas.drawString(x_pos, y_pos, text)
+            canvas.drawString(x_pos, y_pos, footer_text)
             canvas.linkRect(
                 "",
                 toc_bookmark,
-                (x_pos, y_pos, x_pos + text_width, y_pos + 8),
+                (x_pos, y_pos, x_pos + footer_width, y_pos + 8),
                 relative=0,
             )
 
@@ -1,6 +1,7 @@
+import sys
 from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 from mawa.schemas.ocr_schema import Dimensions, Image
 
@@ -11,6 +12,12 @@ class Paragraph(BaseModel):
     tag: Optional[str] = None
     source_ref: Optional[str] = None
 
+    @field_validator("content")
+    @classmethod
+    def intern_content(cls, content: str) -> str:
+        """Share the contents repeated across pages (headers, footers) in memory"""
+        return sys.intern(content) if len(content) < 4096 else content
+
 
 class Page(BaseModel):
     index: int
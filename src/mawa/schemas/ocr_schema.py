@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+import base64
 from typing import Literal, Optional
 
+from pydantic import BaseModel
+
 
 class Image(BaseModel):
     name_img: str
@@ -8,7 +10,14 @@ class Image(BaseModel):
     top_left_y: int
     bottom_right_x: int
     bottom_right_y: int
-    image_base64: str
+    # Kept as ASCII bytes, hashing and decoding then work without re-encoding.
+    # It is still serialized as a JSON string.
+    image_base64: bytes
+
+    @property
+    def image_bytes(self) -> bytes:
+        """The decoded image, not cached so it is freed once the caller is done"""
+        return base64.b64decode(self.image_base64)
 
 
 class Dimensions(BaseModel):
@@ -1,11 +1,16 @@
 import json
 from pathlib import Path
-from typing import Optional
+from typing import Optional, TypeVar
 
+import orjson
 import yaml
+from pydantic import BaseModel
+from pydantic_core import to_json
 
 from mawa.config import CONFIG_DIR
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
 
 def save_json(data: dict, file_path: Path) -> None:
     """Save a dictionary to a JSON file.
@@ -18,14 +23,38 @@ def save_json(data: dict, file_path: Path) -> None:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
 
+def save_model_json(model: BaseModel, file_path: Path) -> None:
+    """Save a Pydantic model to a JSON file.
+    The model is serialized directly to bytes, without building an intermediate
+    dictionary or string.
+
+    Args:
+        model (BaseModel): The model to save.
+        file_path (Path): Path to the file to save the model to.
+    """
+    # to_json uses the aliases by default, unlike model_dump_json
+    file_path.write_bytes(to_json(model, indent=4, by_alias=False))
+
+
 def read_json(file_path: Path) -> dict:
     """Read a JSON file and return the dictionary.
 
     Args:
         file_path (Path): Path to the file to read the dictionary from.
     """
-    with open(file_path, "r") as f:
-        return json.load(f)
+    return orjson.loads(Path(file_path).read_bytes())
+
+
+def read_model_json(model_class: type[ModelT], file_path: Path) -> ModelT:
+    """Read a JSON file and validate it as a Pydantic model.
+    The JSON is parsed and validated in a single pass, without building an
+    intermediate dictionary.
+
+    Args:
+        model_class (type[BaseModel]): The model to validate the file with.
+        file_path (Path): Path to the file to read the model from.
+    """
+    return model_class.model_validate_json(Path(file_path).read_bytes())
 
 
 def read_data_tree(subtree: Optional[str] = None) -> dict:
@@ -0,0 +1,51 @@
+"""Test for the batch_input_tokens_metadata method of the Gemini model."""
+
+import unittest
+from unittest.mock import patch
+
+from google.genai.types import CountTokensResponse
+
+from mawa.models.gemini_model import GeminiModel
+
+
+class TestBatchInputTokensMetadata(unittest.TestCase):
+    """Test that the tokens of several prompts are counted and priced."""
+
+    def setUp(self):
+        """Create a Gemini model with a mocked client."""
+        patcher = patch("mawa.models.gemini_model.genai.Client")
+        client = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.count_tokens = client.return_value.models.count_tokens
+        self.count_tokens.side_effect = lambda model, contents: CountTokensResponse(
+            total_tokens=len(contents) * 1_000
+        )
+        self.model = GeminiModel(model="flash")
+
+    def test_can_be_called_twice(self):
+        """Test that the same model counts several batches in a row."""
+        first = self.model.batch_input_tokens_metadata([["a"], ["a", "b"]])
+        second = self.model.batch_input_tokens_metadata([["a", "b", "c"]])
+
+        self.assertEqual([tokens["total_tokens"] for tokens in first], [1000, 2000])
+        self.assertEqual([tokens["total_tokens"] for tokens in second], [3000])
+        self.assertEqual(self.count_tokens.call_count, 3)
+
+    def test_tokens_metadata_shape(self):
+        """Test that each prompt gets its own priced tokens metadata."""
+        (tokens,) = self.model.batch_input_tokens_metadata([["a", "b"]])
+
+        for key in (
+            "input_token_cost",
+            "output_token_cost",
+            "total_token_cost",
+            "hourly_cache_storage_cost",
+            "storage_cost",
+        ):
+            self.assertIn(key, tokens)
+        self.assertAlmostEqual(tokens["input_token_cost"], 2000 * 0.30 / 1_000_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
 """Test for the clean_document method to verify paragraph modifications work correctly."""
 
-import json
-import shutil
+import base64
+import random
 import tempfile
 import unittest
+from collections import Counter
+from io import BytesIO
 from pathlib import Path
 
+from PIL import Image as PILImage
+
 from mawa.config import City
 from mawa.etl.transform import Transform
 from mawa.schemas.document_schema import Document, Page, Paragraph, Image, Dimensions
@@ -14,17 +18,22 @@ from mawa.schemas.document_schema import Document, Page, Paragraph, Image, Dimen
 class TestCleanDocument(unittest.TestCase):
     """Test that clean_document correctly modifies paragraphs in place."""
 
-    def setUp(self):
-        """Create a temporary document with duplicate images for testing."""
-        # Create a temporary directory for test files
-        self.temp_dir = Path(tempfile.mkdtemp())
-
+    @classmethod
+    def setUpClass(cls):
+        """Create a document with duplicate images, serialized once for all tests."""
+        # The data is trusted, so the models are built without validation
         # Create test document data
-        duplicate_image_b64 = "duplicate_base64_string"
-        unique_image_b64 = "unique_base64_string"
+        duplicate_image_b64 = b"duplicate_base64_string"
+        unique_image_b64 = b"unique_base64_string"
+        # A real JPEG cut short, it only fails once PIL reads its pixels
+        cls.truncated_image_b64 = base64.b64encode(_jpeg_bytes()[:800])
+        # Two different palette images, large enough to be downscaled before hashing
+        cls.palette_images_b64 = [
+            base64.b64encode(_palette_png_bytes(seed)) for seed in (1, 2)
+        ]
 
         # Create images
-        duplicate_image_1 = Image(
+        duplicate_image_1 = Image.model_construct(
             name_img="img1.png",
             top_left_x=0,
             top_left_y=0,
@@ -32,7 +41,7 @@ class TestCleanDocument(unittest.TestCase):
             bottom_right_y=100,
             image_base64=duplicate_image_b64,
         )
-        duplicate_image_2 = Image(
+        duplicate_image_2 = Image.model_construct(
             name_img="img1.png",  # Same name
             top_left_x=0,
             top_left_y=0,
@@ -40,7 +49,7 @@ class TestCleanDocument(unittest.TestCase):
             bottom_right_y=100,
             image_base64=duplicate_image_b64,  # Same base64 (duplicate)
         )
-        unique_image = Image(
+        unique_image = Image.model_construct(
             name_img="img2.png",
             top_left_x=0,
             top_left_y=0,
@@ -48,27 +57,51 @@ class TestCleanDocument(unittest.TestCase):
             bottom_right_y=100,
             image_base64=unique_image_b64,
         )
+        truncated_image = Image.model_construct(
+            name_img="img3.jpeg",
+            top_left_x=0,
+            top_left_y=0,
+            bottom_right_x=100,
+            bottom_right_y=100,
+            image_base64=cls.truncated_image_b64,
+        )
+        palette_images = [
+            Image.model_construct(
+                name_img=f"img{index}.png",
+                top_left_x=0,
+                top_left_y=0,
+                bottom_right_x=600,
+                bottom_right_y=600,
+                image_base64=image_b64,
+            )
+            for index, image_b64 in enumerate(cls.palette_images_b64, start=4)
+        ]
 
         # Create paragraphs with image references
-        paragraph_with_image = Paragraph(
+        paragraph_with_image = Paragraph.model_construct(
             index=1,
             content="This paragraph contains img1.png reference",
         )
-        paragraph_with_image_only = Paragraph(
+        paragraph_with_image_only = Paragraph.model_construct(
             index=2,
             content="img1.png",  # Only the image reference
         )
-        paragraph_without_image = Paragraph(
+        paragraph_without_image = Paragraph.model_construct(
             index=3,
             content="This paragraph has no image reference",
         )
-        paragraph_with_multiple_refs = Paragraph(
+        paragraph_with_multiple_refs = Paragraph.model_construct(
             index=4,
             content="img1.png and some other text img1.png",
         )
+        # Same name as the duplicates, but no image was removed from its page
+        paragraph_with_other_page_ref = Paragraph.model_construct(
+            index=5,
+            content="Figure img1.png of the appendix",
+        )
 
         # Create pages
-        page1 = Page(
+        page1 = Page.model_construct(
             index=1,
             paragraphs=[
                 paragraph_with_image,
@@ -76,19 +109,26 @@ class TestCleanDocument(unittest.TestCase):
                 paragraph_without_image,
             ],
             images=[duplicate_image_1, unique_image],
-            dimensions=Dimensions(dpi=300, width=1000, height=1000),
+            dimensions=Dimensions.model_construct(dpi=300, width=1000, height=1000),
         )
 
-        page2 = Page(
+        page2 = Page.model_construct(
             index=2,
             paragraphs=[paragraph_with_multiple_refs],
-            images=[duplicate_image_2],
-            dimensions=Dimensions(dpi=300, width=1000, height=1000),
+            images=[duplicate_image_2, truncated_image],
+            dimensions=Dimensions.model_construct(dpi=300, width=1000, height=1000),
+        )
+
+        page3 = Page.model_construct(
+            index=3,
+            paragraphs=[paragraph_with_other_page_ref],
+            images=palette_images,
+            dimensions=Dimensions.model_construct(dpi=300, width=1000, height=1000),
         )
 
         # Create document
-        self.test_doc = Document(
-            pages=[page1, page2],
+        cls.test_doc = Document.model_construct(
+            pages=[page1, page2, page3],
             name_of_document="test_document",
             date_of_document="2024-01-01",
             document_type="PLU",
@@ -96,40 +136,35 @@ class TestCleanDocument(unittest.TestCase):
             model_metadata={},
         )
 
-        # Save to temporary file
-        self.test_file = self.temp_dir / "test_document.json"
-        with open(self.test_file, "w") as f:
-            json.dump(self.test_doc.model_dump(), f, indent=2)
+        # Serialize once, every test writes the same bytes
+        cls._doc_bytes = cls.test_doc.model_dump_json(indent=2).encode()
 
         # Store references for later verification
-        self.paragraph_with_image = paragraph_with_image
-        self.paragraph_with_image_only = paragraph_with_image_only
-        self.paragraph_without_image = paragraph_without_image
-        self.paragraph_with_multiple_refs = paragraph_with_multiple_refs
+        cls.paragraph_with_image = paragraph_with_image
+        cls.paragraph_with_image_only = paragraph_with_image_only
+        cls.paragraph_without_image = paragraph_without_image
+        cls.paragraph_with_multiple_refs = paragraph_with_multiple_refs
 
-    def tearDown(self):
-        """Clean up temporary directory."""
-        if self.temp_dir.exists():
-            shutil.rmtree(self.temp_dir)
+    def setUp(self):
+        """Write the test document to a temporary directory."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = Path(temp_dir.name)
+        self.test_file = self.temp_dir / "test_document.json"
+        self.test_file.write_bytes(self._doc_bytes)
 
     def test_paragraphs_modified_in_place(self):
         """Test that paragraph.content modifications affect the original objects."""
         # Create Transform instance
         transform = Transform(City.GRENOBLE, Path("test_document"))
         # Override the file path to use our test file
-        transform.file_path = self.test_file
-
-        # Save our test document
-        with open(self.test_file, "w") as f:
-            json.dump(self.test_doc.model_dump(), f, indent=2)
+        transform.raw_path = self.test_file
 
         # Run clean_document
         result_path = transform.clean_document()
 
         # Reload the document
-        with open(result_path, "r") as f:
-            cleaned_doc_data = json.load(f)
-        cleaned_doc = Document(**cleaned_doc_data)
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
 
         # Verify that paragraphs were modified correctly
         # Paragraph with image reference should have the reference removed
@@ -166,67 +201,87 @@ class TestCleanDocument(unittest.TestCase):
     def test_duplicate_images_removed(self):
         """Test that duplicate images are removed from all pages."""
         transform = Transform(City.GRENOBLE, Path("test_document"))
-        transform.file_path = self.test_file
-
-        # Save our test document
-        with open(self.test_file, "w") as f:
-            json.dump(self.test_doc.model_dump(), f, indent=2)
+        transform.raw_path = self.test_file
 
         # Run clean_document
         result_path = transform.clean_document()
 
         # Reload the document
-        with open(result_path, "r") as f:
-            cleaned_doc_data = json.load(f)
-        cleaned_doc = Document(**cleaned_doc_data)
-
-        # Verify duplicate images are removed
-        page1_images = cleaned_doc.pages[0].images
-        page2_images = cleaned_doc.pages[1].images
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
 
-        # Count images with duplicate base64
+        # Count the images of each page by payload
         # Pydantic converts dictionaries back to Image objects
-        duplicate_b64 = "duplicate_base64_string"
-        page1_duplicate_count = sum(
-            1 for img in page1_images if img.image_base64 == duplicate_b64
-        )
-        page2_duplicate_count = sum(
-            1 for img in page2_images if img.image_base64 == duplicate_b64
-        )
+        page1_counts = Counter(img.image_base64 for img in cleaned_doc.pages[0].images)
+        page2_counts = Counter(img.image_base64 for img in cleaned_doc.pages[1].images)
 
         # Both duplicate images should be removed
+        duplicate_b64 = b"duplicate_base64_string"
         self.assertEqual(
-            page1_duplicate_count, 0, "Page 1 should have no duplicate images"
+            page1_counts[duplicate_b64], 0, "Page 1 should have no duplicate images"
         )
         self.assertEqual(
-            page2_duplicate_count, 0, "Page 2 should have no duplicate images"
+            page2_counts[duplicate_b64], 0, "Page 2 should have no duplicate images"
         )
 
         # Unique image should still be present
-        unique_b64 = "unique_base64_string"
-        page1_unique_count = sum(
-            1 for img in page1_images if img.image_base64 == unique_b64
-        )
+        unique_b64 = b"unique_base64_string"
         self.assertEqual(
-            page1_unique_count, 1, "Page 1 should still have the unique image"
+            page1_counts[unique_b64], 1, "Page 1 should still have the unique image"
         )
 
+    def test_truncated_image_kept(self):
+        """Test that an image that can't be decoded doesn't abort the cleaning."""
+        transform = Transform(City.GRENOBLE, Path("test_document"))
+        transform.raw_path = self.test_file
+
+        # Run clean_document
+        result_path = transform.clean_document()
+
+        # Reload the document
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
+
+        # The truncated image has no duplicate, so it is kept
+        page2_payloads = [img.image_base64 for img in cleaned_doc.pages[1].images]
+        self.assertEqual(page2_payloads, [self.truncated_image_b64])
+
+    def test_palette_images_kept(self):
+        """Test that palette images are hashed and kept when they differ."""
+        transform = Transform(City.GRENOBLE, Path("test_document"))
+        transform.raw_path = self.test_file
+
+        # Run clean_document
+        result_path = transform.clean_document()
+
+        # Reload the document
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
+
+        page3_payloads = [img.image_base64 for img in cleaned_doc.pages[2].images]
+        self.assertEqual(page3_payloads, self.palette_images_b64)
+
+    def test_references_kept_on_other_pages(self):
+        """Test that references are only stripped on the pages the images left."""
+        transform = Transform(City.GRENOBLE, Path("test_document"))
+        transform.raw_path = self.test_file
+
+        # Run clean_document
+        result_path = transform.clean_document()
+
+        # Reload the document
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
+
+        page3_contents = [p.content for p in cleaned_doc.pages[2].paragraphs]
+        self.assertEqual(page3_contents, ["Figure img1.png of the appendix"])
+
     def test_empty_paragraphs_removed(self):
         """Test that paragraphs that become empty after image removal are deleted."""
         transform = Transform(City.GRENOBLE, Path("test_document"))
-        transform.file_path = self.test_file
-
-        # Save our test document
-        with open(self.test_file, "w") as f:
-            json.dump(self.test_doc.model_dump(), f, indent=2)
+        transform.raw_path = self.test_file
 
         # Run clean_document
         result_path = transform.clean_document()
 
         # Reload the document
-        with open(result_path, "r") as f:
-            cleaned_doc_data = json.load(f)
-        cleaned_doc = Document(**cleaned_doc_data)
+        cleaned_doc = Document.model_validate_json(result_path.read_text())
 
         # Verify that the paragraph containing only the image reference is removed
         page1_paragraphs = cleaned_doc.pages[0].paragraphs
@@ -239,5 +294,26 @@ class TestCleanDocument(unittest.TestCase):
             self.assertTrue(paragraph.content.strip(), "No paragraph should be empty")
 
 
+def _jpeg_bytes() -> bytes:
+    """Encode a noisy image as a JPEG large enough to be cut short."""
+    rng = random.Random(0)
+    image = PILImage.new("L", (256, 256))
+    image.putdata([rng.randrange(256) for _ in range(256 * 256)])
+    buffer = BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _palette_png_bytes(seed: int) -> bytes:
+    """Encode a noisy 600x600 palette (mode P) image as a PNG."""
+    rng = random.Random(seed)
+    small = PILImage.new("L", (8, 8))
+    small.putdata([rng.randrange(256) for _ in range(64)])
+    image = small.resize((600, 600)).convert("P")
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
 if __name__ == "__main__":
     unittest.main()
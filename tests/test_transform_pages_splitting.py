@@ -0,0 +1,77 @@
+"""Test for the pages_splitting method to verify where the page split is saved."""
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from google.genai.types import (
+    GenerateContentResponse,
+    GenerateContentResponseUsageMetadata,
+)
+
+from mawa.config import City
+from mawa.etl.transform import Transform
+from mawa.schemas.document_schema import Dimensions, Document, Page, Paragraph
+from mawa.utils import read_json
+
+
+class TestPagesSplitting(unittest.TestCase):
+    """Test that pages_splitting saves the model response as a file."""
+
+    def setUp(self):
+        """Create a temporary formatted document."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = Path(temp_dir.name)
+
+        document = Document(
+            pages=[
+                Page(
+                    index=1,
+                    paragraphs=[Paragraph(index=1, content="Zone UA")],
+                    images=[],
+                    dimensions=Dimensions(dpi=300, width=1000, height=1000),
+                )
+            ],
+            name_of_document="test_document",
+            date_of_document="2024-01-01",
+            document_type="PLU",
+            city=City.GRENOBLE.value,
+            model_metadata={},
+        )
+
+        self.transform = Transform(City.GRENOBLE, "test_document")
+        self.transform.raw_path = self.temp_dir / "test_document.json"
+        self.transform.page_split_path = (
+            self.temp_dir / "split" / "test_document.page_split.json"
+        )
+        self.transform.raw_path.write_text(document.model_dump_json())
+
+    def test_page_split_path_is_a_file(self):
+        """Test that the page split is written to a file, not a directory."""
+        # The pages schema answers with a list, which the validated parsed field
+        # rejects, hence model_construct
+        parsed = [{"zone": "UA", "pages": [1]}]
+        with patch("mawa.etl.transform.GeminiModel") as gemini_model:
+            gemini_model.return_value.generate_content.return_value = (
+                GenerateContentResponse.model_construct(
+                    parsed=parsed,
+                    usage_metadata=GenerateContentResponseUsageMetadata(
+                        prompt_token_count=10
+                    ),
+                )
+            )
+
+            self.transform.pages_splitting()
+
+        self.assertTrue(self.transform.page_split_path.is_file())
+        page_split = read_json(self.transform.page_split_path)
+        self.assertEqual(page_split["parsed"], parsed)
+        # The keys are written by field name, as model_dump_json does
+        self.assertEqual(page_split["usage_metadata"]["prompt_token_count"], 10)
+        self.assertNotIn("usageMetadata", page_split)
+
+
+if __name__ == "__main__":
+    unittest.main()
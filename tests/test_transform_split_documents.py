@@ -0,0 +1,73 @@
+"""Test for the split_documents method to verify how zone documents are written."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from mawa.config import City
+from mawa.etl.transform import Transform
+from mawa.schemas.document_schema import Dimensions, Document, Page, Paragraph
+
+
+class TestSplitDocuments(unittest.TestCase):
+    """Test that split_documents writes one document per zone."""
+
+    def setUp(self):
+        """Create a temporary formatted document and its page split."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = Path(temp_dir.name)
+
+        document = Document(
+            pages=[
+                Page(
+                    index=index,
+                    paragraphs=[Paragraph(index=1, content=f"Page {index}")],
+                    images=[],
+                    dimensions=Dimensions(dpi=300, width=1000, height=1000),
+                )
+                for index in range(1, 5)
+            ],
+            name_of_document="test_document",
+            date_of_document="2024-01-01",
+            document_type="PLU",
+            city=City.GRENOBLE.value,
+            model_metadata={},
+        )
+
+        self.transform = Transform(City.GRENOBLE, "test_document")
+        self.transform.raw_path = self.temp_dir / "test_document.json"
+        self.transform.page_split_path = (
+            self.temp_dir / "test_document.page_split.json"
+        )
+        self.transform.interim_dir = self.temp_dir / "interim"
+        self.transform.raw_path.write_text(document.model_dump_json())
+
+    def test_repeated_zone_pages_are_merged(self):
+        """Test that a zone returned twice is written once with all its pages."""
+        page_splitting = {
+            "parsed": [
+                {"zone": "UA", "pages": [1, 2]},
+                {"zone": "UB", "pages": [4]},
+                {"zone": "UA", "pages": [2, 3]},
+            ]
+        }
+        self.transform.page_split_path.write_text(json.dumps(page_splitting))
+
+        self.transform.split_documents()
+
+        doc_ua = Document.model_validate_json(
+            (self.transform.interim_dir / "UA.json").read_text()
+        )
+        self.assertEqual(doc_ua.zone, "UA")
+        self.assertEqual([page.index for page in doc_ua.pages], [1, 2, 3])
+
+        doc_ub = Document.model_validate_json(
+            (self.transform.interim_dir / "UB.json").read_text()
+        )
+        self.assertEqual([page.index for page in doc_ub.pages], [4])
+
+
+if __name__ == "__main__":
+    unittest.main()